@@ -1,11 +1,21 @@
+import os
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from src.utils import setup_logging, load_env_vars
+
+# Configure logging before importing modules that log at import time
+setup_logging()
+
 from src.chatbot import MedicalChatbot
-from src.utils import load_env_vars
 
 load_env_vars()
 
-
+# Tuning knobs (environment variables):
+#   UVICORN_WORKERS      - number of worker processes when run via `python app.py` (default 1).
+#                          Each worker holds its own bot and chat history.
+#   LLM_MAX_CONCURRENCY  - in-flight Gemini/HF calls per worker (default 8), see src/chatbot.py.
+#                          Keep workers * concurrency under your upstream API rate limits.
 
 app = FastAPI()
 bot = MedicalChatbot()
@@ -23,11 +33,25 @@ class ChatRequest(BaseModel):
     question: str
 
 @app.post("/chat")
-def chat(request: ChatRequest):
-    answer = bot.get_answer(request.question)
+async def chat(request: ChatRequest):
+    answer = await bot.get_answer(request.question)
     return {"answer": answer}
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    # Server-sent events, one per generated chunk of the answer
+    return StreamingResponse(bot.stream_answer(request.question), media_type="text/event-stream")
+
 @app.post("/clear")
-def clear_history():
+async def clear_history():
     bot.clear_history()
-    return {"status": "history cleared"}
\ No newline at end of file
+    return {"status": "history cleared"}
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(
+        "app:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "5000")),
+        workers=int(os.getenv("UVICORN_WORKERS", "1")),
+    )
\ No newline at end of file
@@ -1,4 +1,5 @@
 import argparse
+import asyncio
 import os
 import sys
 import warnings
@@ -17,9 +18,8 @@ for _name in ["tensorflow", "tf_keras", "httpx", "chromadb",
     logging.getLogger(_name).setLevel(logging.ERROR)
 # ─────────────────────────────────────────────────────────────────
 
-from src.ingest import ingest_documents
-from src.vector_store import index_documents, clear_vector_store
-from src.chatbot import MedicalChatbot
+# The pipeline modules pull in langchain, chromadb, faiss and the model clients, so they
+# are imported inside the branches that need them to keep --help and --clear-db fast
 from src.utils import setup_logging, load_env_vars
 
 logger = setup_logging()
@@ -28,6 +28,7 @@ def main():
     parser = argparse.ArgumentParser(description="Medical Assistant Chatbot CLI")
     parser.add_argument('--ingest', action='store_true', help='Ingest documents from data folder')
     parser.add_argument('--clear-db', action='store_true', help='Clear the vector database')
+    parser.add_argument('--build-index', action='store_true', help='Rebuild the FAISS serving index from the vector database')
     parser.add_argument('--chat', action='store_true', help='Start chat mode')
     parser.add_argument('--data-dir', type=str, default='data', help='Directory for data ingestion')
 
@@ -37,20 +38,33 @@ def main():
     load_env_vars()
 
     if args.clear_db:
+        from src.storage import clear_vector_store
         clear_vector_store()
         print("Vector database cleared.")
 
     if args.ingest:
+        from src.ingest import ingest_documents
+        from src.vector_store import get_embeddings, index_documents, build_faiss_index
         print(f"Ingesting documents from {args.data_dir}...")
         docs = ingest_documents(args.data_dir)
         if docs:
-            index_documents(docs)
+            # One embeddings client for indexing and the FAISS build
+            embeddings = get_embeddings()
+            asyncio.run(index_documents(docs, embeddings))
+            build_faiss_index(embeddings)
             print(f"Successfully indexed {len(docs)} chunks.")
         else:
             print("No documents found or failed to load.")
 
+    if args.build_index and not args.ingest:
+        from src.vector_store import build_faiss_index
+        build_faiss_index()
+
     if args.chat:
+        from src.chatbot import MedicalChatbot
         bot = MedicalChatbot()
+        # One event loop for the whole session so the async LLM clients stay bound to it
+        loop = asyncio.new_event_loop()
         print("\n=== HealixAI Chatbot ===")
         print("HealixAI: Hi there! I'm HealixAI, your medical assistant. How can I help you today?")
         
@@ -69,7 +83,7 @@ def main():
                     continue
                 
                 print("HealixAI is thinking...", end='\r')
-                response = bot.get_answer(user_input)
+                response = loop.run_until_complete(bot.get_answer(user_input))
                 print(f"HealixAI: {response}\n")
                 
             except KeyboardInterrupt:
@@ -79,7 +93,9 @@ def main():
                 logger.error(f"Unexpected error: {e}")
                 print("\nAn error occurred. Check logs for details.")
 
-    if not any([args.ingest, args.clear_db, args.chat]):
+        loop.close()
+
+    if not any([args.ingest, args.clear_db, args.build_index, args.chat]):
         parser.print_help()
 
 if __name__ == "__main__":
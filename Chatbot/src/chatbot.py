@@ -1,17 +1,39 @@
-from typing import List, Tuple
-from langchain_core.messages import HumanMessage, AIMessage
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import AsyncIterator, Deque, List
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 from src.rag_engine import get_rag_chain
-from src.utils import setup_logging
 
-logger = setup_logging()
+logger = logging.getLogger(__name__)
+
+# Max number of RAG calls this bot keeps in flight against Gemini / HF at once.
+# Raise it if your API quota allows more parallel requests, lower it on 429s.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+ERROR_ANSWER = "I apologize, but I encountered an error while processing your request. Please try again."
+
+def format_sse(data: str) -> str:
+    """
+    Formats data as a server-sent event; every line needs its own data: field.
+    """
+    return "".join(f"data: {line}\n" for line in data.split("\n")) + "\n"
 
 class MedicalChatbot:
+    # Only the most recent turns are kept and sent to the LLM to keep prompt size bounded
+    MAX_HISTORY_TURNS = 8
+
     def __init__(self):
         self.chain = get_rag_chain()
-        self.chat_history: List[Tuple[str, str]] = [] # List of (human, ai) tuples
+        # Alternating Human/AI messages, ready for LangChain; the oldest turn is evicted automatically
+        self.chat_history: Deque[BaseMessage] = deque(maxlen=2 * self.MAX_HISTORY_TURNS)
+        # History is shared between concurrent requests, so guard its mutation
+        self._history_lock = asyncio.Lock()
+        self._llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
         logger.info("Medical Chatbot initialized.")
 
-    def get_answer(self, query: str) -> str:
+    async def get_answer(self, query: str) -> str:
         """
         Processes the query and returns the answer.
         """
@@ -19,25 +41,22 @@ class MedicalChatbot:
             return ""
 
         logger.info(f"Processing query: {query}")
-        
-        # Convert history format for LangChain
-        # LangChain expects a list of BaseMessage objects
-        lc_history = []
-        for h_msg, ai_msg in self.chat_history:
-            lc_history.append(HumanMessage(content=h_msg))
-            lc_history.append(AIMessage(content=ai_msg))
-        
+
+        lc_history = await self._recent_history()
+
         try:
-            response = self.chain.invoke({
-                "input": query,
-                "chat_history": lc_history
-            })
-            
+            # The lock is not held here so other requests can overlap on network I/O
+            async with self._llm_slots:
+                response = await self.chain.ainvoke({
+                    "input": query,
+                    "chat_history": lc_history
+                })
+
             answer = response["answer"]
-            
+
             # Update history
-            self.chat_history.append((query, answer))
-            
+            await self._record_turn(query, answer)
+
             # Retrieve source documents from response if needed for detailed inspection
             # context = response.get("context", [])
             # for doc in context:
@@ -46,8 +65,50 @@ class MedicalChatbot:
             return answer
         except Exception as e:
             logger.error(f"Error generating answer: {e}")
-            return "I apologize, but I encountered an error while processing your request. Please try again."
+            return ERROR_ANSWER
+
+    async def stream_answer(self, query: str) -> AsyncIterator[str]:
+        """
+        Processes the query and streams the answer as server-sent events.
+        The turn is added to the history once the answer is complete.
+        """
+        if not query:
+            return
+
+        logger.info(f"Streaming query: {query}")
+
+        lc_history = await self._recent_history()
+
+        parts = []
+        try:
+            async with self._llm_slots:
+                async for chunk in self.chain.astream({
+                    "input": query,
+                    "chat_history": lc_history
+                }):
+                    token = chunk.get("answer")
+                    if token:
+                        parts.append(token)
+                        yield format_sse(token)
+        except Exception as e:
+            logger.error(f"Error streaming answer: {e}")
+            yield format_sse(ERROR_ANSWER)
+            return
+
+        await self._record_turn(query, "".join(parts))
+
+    async def _recent_history(self) -> List[BaseMessage]:
+        """
+        Snapshot of the last MAX_HISTORY_TURNS (human, ai) pairs.
+        The copy also keeps turns appended by concurrent requests from leaking in.
+        """
+        async with self._history_lock:
+            return list(self.chat_history)
+
+    async def _record_turn(self, query: str, answer: str):
+        async with self._history_lock:
+            self.chat_history.extend([HumanMessage(content=query), AIMessage(content=answer)])
 
     def clear_history(self):
-        self.chat_history = []
+        self.chat_history.clear()
         logger.info("Chat history cleared.")
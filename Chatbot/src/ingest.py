@@ -1,46 +1,189 @@
+import logging
 import os
 import re
-from typing import List
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+import tiktoken
 from langchain_community.document_loaders import PyPDFLoader, CSVLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_text_splitters import RecursiveCharacterTextSplitter, TextSplitter
 from langchain_core.documents import Document
-from cleantext import clean
 from src.utils import setup_logging
 
-logger = setup_logging()
+logger = logging.getLogger(__name__)
+
+# Typographic quotes, dashes, fraction slashes and the symbols that carry dose/unit
+# meaning, folded to ASCII after NFKD so the encode doesn't drop them
+# (e.g. "5 \u00b5g" must not become "5 g", nor "\u00bd tablet" become "12 tablet")
+_ASCII_PUNCTUATION = str.maketrans({
+    "\u2018": "'", "\u2019": "'", "\u201a": "'", "\u201b": "'",
+    "\u201c": '"', "\u201d": '"', "\u201e": '"', "\u201f": '"',
+    "\u2010": "-", "\u2011": "-", "\u2012": "-", "\u2013": "-", "\u2014": "-", "\u2212": "-",
+    "\u2044": "/", "\u2215": "/",
+    "\u00b5": "u", "\u03bc": "u",
+    "\u00b1": "+/-", "\u2265": ">=", "\u2264": "<=", "\u00d7": "x",
+    "\u00b0": " deg",
+    # PDF bullets, so the chunker still sees list items
+    "\u2022": "-", "\u2023": "-", "\u25aa": "-", "\u25e6": "-", "\u2043": "-",
+})
+# Superscript exponents, written out as ^ before NFKD would flatten "10\u207b\u00b3" into "103"
+_SUPERSCRIPT_RE = re.compile("[\u2070\u00b9\u00b2\u00b3\u2074-\u2079\u207a\u207b]+")
+_SUPERSCRIPT_DIGITS = str.maketrans(
+    "\u2070\u00b9\u00b2\u00b3\u2074\u2075\u2076\u2077\u2078\u2079\u207a\u207b",
+    "0123456789+-",
+)
+# Runs of whitespace other than line breaks
+_INLINE_SPACE_RE = re.compile(r"[^\S\n]+")
+# Whitespace around line breaks
+_LINE_EDGE_SPACE_RE = re.compile(r"[^\S\n]*\n[^\S\n]*")
+# Lines of 1-3 characters (once stripped) that might be page numbers or headers;
+# code fence lines are kept so the chunker can find where code blocks end
+_SHORT_LINE_RE = re.compile(r"^(?!```|~~~)\S(?:[^\n]?\S)?(?:\n|\Z)", re.M)
+# More than one blank line in a row
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+# Soft token budget per chunk
+CHUNK_TOKENS = 800
+# tiktoken has no Gemini encoding; cl100k_base is close enough for sizing chunks
+TOKEN_ENCODING = "cl100k_base"
+
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+_TABLE_ROW_RE = re.compile(r"^\s*\|.*\|\s*$")
+_TABLE_SEPARATOR_RE = re.compile(r"^\s*\|[\s:|-]+\|\s*$")
+_LIST_ITEM_RE = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+")
+# Markdown headings, or short ALL-CAPS lines as PDF section titles usually come out
+_HEADING_RE = re.compile(r"^\s*(?:#{1,6}\s+\S.*|[A-Z][A-Z0-9 ,:&/()'-]{2,80})\s*$")
 
 def clean_text_content(text: str) -> str:
     """
     Cleans the text content by removing headers/footers, normalizing whitespace, etc.
     """
-    # Basic cleaning using clean-text library
-    cleaned = clean(text, 
-        fix_unicode=True, 
-        to_ascii=True, 
-        lower=False, 
-        no_line_breaks=False,
-        no_urls=False, 
-        no_emails=False, 
-        no_phone_numbers=False, 
-        no_numbers=False, 
-        no_digits=False, 
-        no_currency_symbols=False, 
-        no_punct=False, 
-        replace_with_url="<URL>", 
-        replace_with_email="<EMAIL>", 
-        replace_with_phone_number="<PHONE>", 
-        replace_with_number="<NUMBER>", 
-        replace_with_digit="0", 
-        replace_with_currency_symbol="<CUR>",
-        lang="en"
-    )
-    
+    # ASCII transliteration: NFKD splits accented letters, ligatures and vulgar
+    # fractions so that only combining marks and non-Latin characters are dropped
+    cleaned = _SUPERSCRIPT_RE.sub(lambda m: "^" + m.group().translate(_SUPERSCRIPT_DIGITS), text)
+    cleaned = unicodedata.normalize("NFKD", cleaned).translate(_ASCII_PUNCTUATION)
+    cleaned = cleaned.encode("ascii", "ignore").decode("ascii")
+
+    cleaned = _INLINE_SPACE_RE.sub(" ", cleaned)
+    cleaned = _LINE_EDGE_SPACE_RE.sub("\n", cleaned).strip()
     # Custom cleaning for headers/footers (heuristic: short lines at start/end of pages)
     # This is rudimentary; sophisticated cleaning requires visual layout analysis.
-    lines = cleaned.split('\n')
-    # Remove very short lines that might be page numbers or headers
-    filtered_lines = [line for line in lines if len(line.strip()) > 3 or line.strip() == ""]
-    return "\n".join(filtered_lines)
+    cleaned = _SHORT_LINE_RE.sub("", cleaned)
+    cleaned = _BLANK_LINES_RE.sub("\n\n", cleaned)
+    return cleaned.strip()
+
+def split_into_blocks(text: str) -> List[Tuple[str, str]]:
+    """
+    Splits text into structural blocks.
+    Returns a list of (kind, text) where kind is heading, paragraph, list, table or code.
+    """
+    blocks = []
+    current_kind, current_lines = None, []
+
+    def flush():
+        nonlocal current_kind, current_lines
+        if current_lines:
+            blocks.append((current_kind, "\n".join(current_lines)))
+        current_kind, current_lines = None, []
+
+    for line in text.split("\n"):
+        if current_kind == "code":
+            current_lines.append(line)
+            if _FENCE_RE.match(line):
+                flush()
+        elif _FENCE_RE.match(line):
+            flush()
+            current_kind, current_lines = "code", [line]
+        elif _TABLE_ROW_RE.match(line):
+            if current_kind != "table":
+                flush()
+                current_kind = "table"
+            current_lines.append(line)
+        elif not line.strip():
+            flush()
+        elif _HEADING_RE.match(line):
+            flush()
+            blocks.append(("heading", line))
+        elif _LIST_ITEM_RE.match(line):
+            if current_kind != "list":
+                flush()
+                current_kind = "list"
+            current_lines.append(line)
+        else:
+            # Continuation lines stay with the list item they wrap from
+            if current_kind not in ("paragraph", "list"):
+                flush()
+                current_kind = "paragraph"
+            current_lines.append(line)
+
+    flush()
+    return blocks
+
+class StructuralTextSplitter(TextSplitter):
+    """
+    Packs structural blocks (headings, paragraphs, lists, tables, code) into chunks of
+    up to chunk_tokens tokens. Tables are only split between rows, and every table
+    continuation repeats the table header. Headings are kept with the block that follows.
+    """
+
+    def __init__(self, chunk_tokens: int = CHUNK_TOKENS, encoding_name: str = TOKEN_ENCODING, **kwargs):
+        self._encoding = tiktoken.get_encoding(encoding_name)
+        super().__init__(chunk_size=chunk_tokens, chunk_overlap=0, length_function=self._count_tokens, **kwargs)
+        # Used for oversized paragraphs, lists and code blocks
+        self._fallback_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            encoding_name=encoding_name,
+            chunk_size=chunk_tokens,
+            chunk_overlap=50,
+        )
+
+    def _count_tokens(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def _split_table(self, table: str) -> List[str]:
+        rows = table.split("\n")
+        header_size = 2 if len(rows) > 1 and _TABLE_SEPARATOR_RE.match(rows[1]) else 1
+        header, rows = rows[:header_size], rows[header_size:]
+        header_tokens = self._count_tokens("\n".join(header))
+
+        parts, current, current_tokens = [], [], header_tokens
+        for row in rows:
+            row_tokens = self._count_tokens(row)
+            if current and current_tokens + row_tokens > self._chunk_size:
+                parts.append("\n".join(header + current))
+                current, current_tokens = [], header_tokens
+            current.append(row)
+            current_tokens += row_tokens
+        if current:
+            parts.append("\n".join(header + current))
+        return parts
+
+    def split_text(self, text: str) -> List[str]:
+        pieces = []
+        for kind, block in split_into_blocks(text):
+            if kind == "heading" or self._count_tokens(block) <= self._chunk_size:
+                pieces.append((kind, block))
+            elif kind == "table":
+                pieces.extend(("table", part) for part in self._split_table(block))
+            else:
+                pieces.extend((kind, part) for part in self._fallback_splitter.split_text(block))
+
+        chunks, current, current_tokens = [], [], 0
+        for kind, piece in pieces:
+            piece_tokens = self._count_tokens(piece)
+            if current and current_tokens + piece_tokens > self._chunk_size:
+                # Carry trailing headings over so they stay with their content
+                carried = []
+                while current and current[-1][0] == "heading":
+                    carried.insert(0, current.pop())
+                if current:
+                    chunks.append("\n\n".join(text for _, text in current))
+                current = carried
+                current_tokens = sum(self._count_tokens(text) for _, text in carried)
+            current.append((kind, piece))
+            current_tokens += piece_tokens
+        if current:
+            chunks.append("\n\n".join(text for _, text in current))
+        return chunks
 
 def determine_metadata(file_path: str):
     """
@@ -61,62 +204,76 @@ def determine_metadata(file_path: str):
     else:
         return 'textbook', 2 # Default to textbook
 
+def _load_and_clean(file_path: str) -> List[Document]:
+    """
+    Loads a single PDF or CSV file, cleans its pages and attaches metadata.
+    Runs in a worker process, so errors are logged and an empty list is returned.
+    """
+    filename = os.path.basename(file_path)
+    doc_type, rank = determine_metadata(file_path)
+
+    try:
+        if filename.endswith('.pdf'):
+            loader = PyPDFLoader(file_path)
+        else:
+            loader = CSVLoader(file_path, encoding="utf-8")
+        loaded_docs = loader.load()
+
+        print(f"  Loaded: {filename} ({len(loaded_docs)} pages/rows)", flush=True)
+        # Sanitize filename for logging to avoid UnicodeEncodeError on some Windows consoles
+        safe_filename = filename.encode('ascii', 'replace').decode('ascii')
+        logger.info(f"Loaded {len(loaded_docs)} pages/rows from {safe_filename}")
+
+        for doc in loaded_docs:
+            # Clean content
+            doc.page_content = clean_text_content(doc.page_content)
+
+            # Update metadata
+            doc.metadata['source'] = filename
+            doc.metadata['type'] = doc_type
+            doc.metadata['rank'] = rank
+            # Ensure page number exists (CSV loader might not have it)
+            if 'page' not in doc.metadata:
+                doc.metadata['page'] = 'N/A' # CSV row usually
+
+        return loaded_docs
+
+    except Exception as e:
+        logger.error(f"Error loading {filename}: {e}")
+        return []
+
 def ingest_documents(data_dir: str) -> List[Document]:
     """
     Loads all PDFs and CSVs from the data directory, cleans them, and chunks them.
+    Files are loaded and cleaned in parallel, one worker process per CPU core.
     """
     documents = []
-    
+
     if not os.path.exists(data_dir):
         logger.error(f"Data directory {data_dir} does not exist.")
         return []
 
-    for filename in os.listdir(data_dir):
-        file_path = os.path.join(data_dir, filename)
-        doc_type, rank = determine_metadata(file_path)
-        
-        loaded_docs = []
-        try:
-            print(f"  Loading: {filename}...", end=" ", flush=True)
-            if filename.endswith('.pdf'):
-                loader = PyPDFLoader(file_path)
-                loaded_docs = loader.load()
-            elif filename.endswith('.csv'):
-                loader = CSVLoader(file_path, encoding="utf-8")
-                loaded_docs = loader.load()
-            else:
-                continue # Skip unsupported files
-            
-            print(f"{len(loaded_docs)} pages/rows loaded.")
-            # Sanitize filename for logging to avoid UnicodeEncodeError on some Windows consoles
-            safe_filename = filename.encode('ascii', 'replace').decode('ascii')
-            logger.info(f"Loaded {len(loaded_docs)} pages/rows from {safe_filename}")
-
-            for doc in loaded_docs:
-                # Clean content
-                doc.page_content = clean_text_content(doc.page_content)
-                
-                # Update metadata
-                doc.metadata['source'] = filename
-                doc.metadata['type'] = doc_type
-                doc.metadata['rank'] = rank
-                # Ensure page number exists (CSV loader might not have it)
-                if 'page' not in doc.metadata:
-                    doc.metadata['page'] = 'N/A' # CSV row usually
-                
-                documents.append(doc)
-                
-        except Exception as e:
-            logger.error(f"Error loading {filename}: {e}")
+    file_paths = [
+        os.path.join(data_dir, filename)
+        for filename in os.listdir(data_dir)
+        if filename.endswith(('.pdf', '.csv')) # Skip unsupported files
+    ]
+    if file_paths:
+        print(f"  Loading {len(file_paths)} files...")
+        max_workers = min(len(file_paths), os.cpu_count() or 1)
+        # Spawned workers (Windows/macOS) start with unconfigured logging, so set it up
+        # there too; under fork the parent's handlers are inherited and this is a no-op
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=setup_logging) as executor:
+            for loaded_docs in executor.map(_load_and_clean, file_paths):
+                documents.extend(loaded_docs)
 
     # Chunking
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=3000, # Approx 600-800 tokens (1 token ~ 4 chars)
-        chunk_overlap=200, # Approx 50 tokens
-        separators=["\n\n", "\n", " ", ""]
-    )
+    text_splitter = StructuralTextSplitter(chunk_tokens=CHUNK_TOKENS)
     
     chunked_docs = text_splitter.split_documents(documents)
+    # Single-line content used when formatting retrieved context, so it isn't redone per query
+    for doc in chunked_docs:
+        doc.metadata['flat_content'] = doc.page_content.replace("\n", " ")
     print(f"  Chunking complete: {len(chunked_docs)} chunks created.")
     logger.info(f"Total chunks created: {len(chunked_docs)}")
     
@@ -124,6 +281,7 @@ def ingest_documents(data_dir: str) -> List[Document]:
 
 if __name__ == "__main__":
     # Test run
+    setup_logging()
     docs = ingest_documents('data')
     if docs:
         print(f"Sample chunk: {docs[0].page_content[:200]}")
@@ -1,44 +1,72 @@
+import functools
+import logging
 import os
-from typing import List, Dict, Any
+import re
+from typing import List, Dict, Any, AsyncIterator
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
+from langchain_core.runnables.utils import AddableDict
 from src.vector_store import get_vector_store
 from src.utils import setup_logging, load_env_vars
 
-logger = setup_logging()
+logger = logging.getLogger(__name__)
 load_env_vars()
 
+# Follow-up questions that lean on earlier turns usually contain a reference word
+REF_RE = re.compile(r"\b(it|its|they|them|that|this|these|those|he|she|his|her)\b", re.I)
+# Very short questions ("and for kids?") are rephrased too
+MIN_STANDALONE_WORDS = 4
 
-def format_docs(docs):
+
+def needs_rephrasing(question: str) -> bool:
     """
-    Formats retrieved documents into a string with metadata citations.
+    Cheap check for whether a follow-up question depends on earlier turns.
+    Non-English (e.g. Arabic) questions are always rephrased since REF_RE only covers English.
     """
-    formatted_docs = []
-    for doc in docs:
-        source = doc.metadata.get('source', 'Unknown')
-        page = doc.metadata.get('page', 'N/A')
-        doc_type = doc.metadata.get('type', 'General')
-        rank = doc.metadata.get('rank', 2)
-        content = doc.page_content.replace("\n", " ")
+    return (
+        not question.isascii()
+        or len(question.split()) < MIN_STANDALONE_WORDS
+        or REF_RE.search(question) is not None
+    )
 
-        formatted_docs.append(
-            f"Source: {source} (Page {page}) [Type: {doc_type}, Rank: {rank}]\n"
-            f"Content: {content}\n"
-        )
 
-    return "\n\n".join(formatted_docs)
+def flat_content(doc) -> str:
+    """
+    Returns the document content on a single line.
+    Precomputed at ingest time; computed and cached on the document for older indexes.
+    """
+    content = doc.metadata.get('flat_content')
+    if content is None:
+        content = doc.metadata['flat_content'] = doc.page_content.replace("\n", " ")
+    return content
 
 
+def format_docs(docs):
+    """
+    Formats retrieved documents into a string with metadata citations.
+    """
+    return "\n\n".join([
+        f"Source: {doc.metadata.get('source', 'Unknown')} (Page {doc.metadata.get('page', 'N/A')}) "
+        f"[Type: {doc.metadata.get('type', 'General')}, Rank: {doc.metadata.get('rank', 2)}]\n"
+        f"Content: {flat_content(doc)}\n"
+        for doc in docs
+    ])
+
+
+@functools.lru_cache(maxsize=1)
 def get_rag_chain():
     """
     Creates a conversational RAG chain that handles follow-up questions.
     Uses only langchain_core primitives (no langchain_classic dependency).
+    The chain is stateless, so it is built once per process and shared by all chatbots.
     """
     vector_store = get_vector_store()
     retriever = vector_store.as_retriever(search_kwargs={"k": 5})
 
+    # One client for both the rephrase and answer chains; the default gRPC transport
+    # keeps a persistent HTTP/2 channel open across calls
     llm = ChatGoogleGenerativeAI(
         model="gemini-2.5-flash",
         temperature=0.3,
@@ -62,19 +90,20 @@ def get_rag_chain():
     # Chain that rephrases the question, then retrieves docs
     rephrase_chain = contextualize_q_prompt | llm | StrOutputParser()
 
-    def _history_aware_retrieve(inp: dict) -> List:
-        """If there is chat history, rephrase the question first; then retrieve."""
+    async def _history_aware_retrieve(inp: dict) -> List:
+        """If the question depends on the chat history, rephrase it first; then retrieve."""
         chat_history = inp.get("chat_history", [])
         question = inp["input"]
 
-        if chat_history:
+        # Skip the extra LLM round-trip for questions that already stand on their own
+        if chat_history and needs_rephrasing(question):
             # Rephrase the question so it is self-contained
-            question = rephrase_chain.invoke({
+            question = await rephrase_chain.ainvoke({
                 "input": question,
                 "chat_history": chat_history,
             })
 
-        return retriever.invoke(question)
+        return await retriever.ainvoke(question)
 
     # ── Step 2: QA answer prompt ──────────────────────────────────────────
     qa_system_prompt = """You are a highly reliable Medical Assistant Chatbot.
@@ -102,38 +131,43 @@ def get_rag_chain():
     answer_chain = qa_prompt | llm | StrOutputParser()
 
     # ── Step 3: Full RAG chain combining retrieval + answering ────────────
-    def _full_chain(inp: dict) -> dict:
+    async def _full_chain(inp: dict) -> AsyncIterator[AddableDict]:
         """
-        End-to-end RAG pipeline.
-        Returns {"input": ..., "chat_history": ..., "context": [docs], "answer": str}
+        End-to-end RAG pipeline, streamed.
+        Yields the retrieved context first, then the answer as it is generated.
+        .ainvoke() merges the chunks into
+        {"input": ..., "chat_history": ..., "context": [docs], "answer": str}
         """
         # Retrieve relevant documents (with optional question rephrasing)
-        docs = _history_aware_retrieve(inp)
+        docs = await _history_aware_retrieve(inp)
 
         # Format docs into a single context string
         context_str = format_docs(docs)
 
-        # Generate the answer
-        answer = answer_chain.invoke({
+        yield AddableDict({
             "input": inp["input"],
             "chat_history": inp.get("chat_history", []),
-            "context": context_str,
+            "context": docs,
+            "answer": "",
         })
 
-        return {
+        # Generate the answer
+        async for token in answer_chain.astream({
             "input": inp["input"],
             "chat_history": inp.get("chat_history", []),
-            "context": docs,
-            "answer": answer,
-        }
+            "context": context_str,
+        }):
+            yield AddableDict({"answer": token})
 
-    # Wrap in a RunnableLambda so it behaves like a normal LangChain Runnable
-    # (supports .invoke(), .batch(), .stream(), etc.)
+    # Wrap in a RunnableLambda so it behaves like a normal LangChain Runnable.
+    # _full_chain is an async generator, so use .ainvoke() / .abatch() / .astream();
+    # every step awaits network I/O, letting concurrent requests share one event loop.
     return RunnableLambda(_full_chain)
 
 
 if __name__ == "__main__":
     # Test
+    setup_logging()
     try:
         chain = get_rag_chain()
         print("RAG Chain initialized successfully.")
@@ -0,0 +1,24 @@
+import logging
+import os
+import shutil
+
+# Kept free of heavy imports so the CLI can clear the stores without loading
+# langchain, chromadb or faiss
+
+logger = logging.getLogger(__name__)
+
+# Persistence directory for Chroma
+PERSIST_DIRECTORY = os.path.join(os.getcwd(), "chroma_db")
+# Read-only FAISS index built from Chroma, used for serving retrieval
+FAISS_DIRECTORY = os.path.join(os.getcwd(), "faiss_index")
+
+def clear_vector_store():
+    """
+    Clears the existing vector store by removing the persistence directory and FAISS index.
+    """
+    if os.path.exists(PERSIST_DIRECTORY):
+        shutil.rmtree(PERSIST_DIRECTORY)
+        logger.info("Vector store cleared.")
+    if os.path.exists(FAISS_DIRECTORY):
+        shutil.rmtree(FAISS_DIRECTORY)
+        logger.info("FAISS index cleared.")
@@ -5,7 +5,12 @@ import sys
 def setup_logging(log_file='logs/app.log'):
     """
     Sets up logging configuration.
+    Call once from the entry point; modules use logging.getLogger(__name__).
     """
+    # Already configured (by an earlier call or by the entry point itself)
+    if logging.getLogger().handlers:
+        return logging.getLogger(__name__)
+
     if not os.path.exists('logs'):
         os.makedirs('logs')
 
@@ -30,6 +35,8 @@ def load_env_vars():
     missing_vars = [var for var in required_vars if not os.getenv(var)]
     
     if missing_vars:
-        logging.warning(f"Missing environment variables: {', '.join(missing_vars)}. Make sure they are set in .env or the system environment.")
+        # Module logger rather than logging.warning(), which would implicitly configure
+        # the root logger before the entry point gets to call setup_logging()
+        logging.getLogger(__name__).warning(f"Missing environment variables: {', '.join(missing_vars)}. Make sure they are set in .env or the system environment.")
     else:
-        logging.info("Environment variables loaded successfully.")
+        logging.getLogger(__name__).info("Environment variables loaded successfully.")
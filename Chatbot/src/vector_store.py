@@ -1,22 +1,104 @@
+import asyncio
+import hashlib
+import logging
 import os
-import shutil
+import threading
+from collections import OrderedDict
+from uuid import uuid4
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 from typing import List, Optional
-from langchain_community.vectorstores import Chroma
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import Chroma, FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain_huggingface import HuggingFaceEndpointEmbeddings, HuggingFaceEmbeddings
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from tenacity import before_sleep_log, retry, stop_after_attempt, wait_random_exponential
+from src.storage import PERSIST_DIRECTORY, FAISS_DIRECTORY, clear_vector_store
 from src.utils import setup_logging, load_env_vars
 
-logger = setup_logging()
+logger = logging.getLogger(__name__)
 load_env_vars()
 
-# Persistence directory for Chroma
-PERSIST_DIRECTORY = os.path.join(os.getcwd(), "chroma_db")
+# FAISS index layout: "flat" (FP32), "sq8" (int8 scalar quantized) or "ivfpq" (IVF + product quantized)
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "sq8")
+# IVF-PQ parameters; IVF_NLIST * 39 vectors are needed to train the coarse quantizer well
+IVF_NLIST = 256
+PQ_SUBQUANTIZERS = 64
+PQ_BITS = 8
+IVF_NPROBE = 16
+
+# Number of chunks embedded per request to the embeddings endpoint
+BATCH_SIZE = 128
+# Chunks longer than this are truncated before embedding to stay under the API token limit
+EMBEDDING_MAX_CHARS = 8000
+# Number of batches embedded concurrently; keep under the HF endpoint's rate limit
+EMBEDDING_CONCURRENCY = 8
+# Attempts per batch; retries back off exponentially with jitter, capped at EMBEDDING_RETRY_MAX_WAIT seconds
+EMBEDDING_ATTEMPTS = 3
+EMBEDDING_RETRY_MAX_WAIT = 30
+# Number of query embeddings kept in memory by CachedEmbeddings
+QUERY_CACHE_SIZE = 1024
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings model with an in-memory LRU cache for query embeddings.
+    Document embeddings are passed straight through since ingested text is unique.
+    """
+
+    def __init__(self, embeddings: Embeddings, maxsize: int = QUERY_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.maxsize = maxsize
+        self._cache: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        # Sync retrieval runs in executor threads, so guard the cache
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def _get(self, key: bytes) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+            return vector
+
+    def _put(self, key: bytes, vector: List[float]):
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._put(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self._put(key, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
 
 def get_embeddings():
     """
-    Returns the BGE-M3 embeddings.
+    Returns the BGE-M3 embeddings, with query embeddings cached in memory.
     Tries to use the Inference API if token is present, else falls back to local.
     """
     api_token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
@@ -24,29 +106,135 @@ def get_embeddings():
     
     if api_token:
         logger.info(f"Using HuggingFace Endpoint Embeddings for {model_name}")
-        return HuggingFaceEndpointEmbeddings(
+        embeddings = HuggingFaceEndpointEmbeddings(
             model=model_name,
             huggingfacehub_api_token=api_token
         )
     else:
         logger.warning("HUGGINGFACEHUB_API_TOKEN not found. Falling back to local BGE-M3 (this may be slow to download).")
-        return HuggingFaceEmbeddings(model_name=model_name)
+        embeddings = HuggingFaceEmbeddings(model_name=model_name)
+
+    return CachedEmbeddings(embeddings)
+
+def get_chroma_store(embeddings: Optional[Embeddings] = None):
+    """
+    Returns the Chroma vector store used for ingestion, creating it on first use.
+    Pass embeddings to reuse an existing client instead of creating a new one.
+    """
+    if embeddings is None:
+        embeddings = get_embeddings()
+    logger.info(f"Opening vector store at {PERSIST_DIRECTORY}")
+    return Chroma(persist_directory=PERSIST_DIRECTORY, embedding_function=embeddings)
 
 def get_vector_store():
     """
-    Returns the existing Chroma vector store.
+    Returns the vector store used for retrieval.
+    Serves from the FAISS index if it has been built, else from Chroma.
+    """
+    if not os.path.exists(FAISS_DIRECTORY):
+        return get_chroma_store()
+
+    logger.info(f"Loading FAISS index from {FAISS_DIRECTORY}")
+    # The index pickle is written locally by build_faiss_index, so it is trusted
+    faiss_store = FAISS.load_local(
+        FAISS_DIRECTORY,
+        get_embeddings(),
+        allow_dangerous_deserialization=True,
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+    )
+    ivf_index = faiss.try_extract_index_ivf(faiss_store.index)
+    if ivf_index is not None:
+        ivf_index.nprobe = IVF_NPROBE
+    return faiss_store
+
+def _create_faiss_index(vectors: np.ndarray, index_type: str):
+    """
+    Creates and trains an inner-product FAISS index of the given type for the vectors.
+    """
+    dim = vectors.shape[1]
+
+    if index_type == "ivfpq" and len(vectors) < IVF_NLIST * 39:
+        logger.warning(f"Only {len(vectors)} vectors, too few to train IVF-PQ. Using sq8 instead.")
+        index_type = "sq8"
+
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim)
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    elif index_type == "ivfpq":
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, IVF_NLIST, PQ_SUBQUANTIZERS, PQ_BITS, faiss.METRIC_INNER_PRODUCT)
+    else:
+        raise ValueError(f"Unknown FAISS index type: {index_type}")
+
+    index.train(vectors)
+    return index
+
+def build_faiss_index(embeddings: Optional[Embeddings] = None):
+    """
+    Builds the FAISS index used for serving from all vectors stored in Chroma.
+    Stored vectors are L2-normalized so inner product ranks like cosine similarity,
+    then quantized according to FAISS_INDEX_TYPE.
+    Only stored vectors are read, so no embeddings client is created here; pass one to
+    reuse it (the saved index doesn't include it, get_vector_store attaches one on load).
     """
-    embeddings = get_embeddings()
-    if os.path.exists(PERSIST_DIRECTORY):
-        logger.info(f"Loading existing vector store from {PERSIST_DIRECTORY}")
-        return Chroma(persist_directory=PERSIST_DIRECTORY, embedding_function=embeddings)
+    if embeddings is not None:
+        chroma_store = get_chroma_store(embeddings)
     else:
-        logger.info("No existing vector store found. Creating new one.")
-        return Chroma(embedding_function=embeddings, persist_directory=PERSIST_DIRECTORY)
+        chroma_store = Chroma(persist_directory=PERSIST_DIRECTORY)
+    data = chroma_store._collection.get(include=["embeddings", "documents", "metadatas"])
+    if not data["ids"]:
+        logger.warning("Vector store is empty, skipping FAISS index build.")
+        return
+
+    vectors = np.asarray(data["embeddings"], dtype="float32")
+    faiss.normalize_L2(vectors)
+    index = _create_faiss_index(vectors, FAISS_INDEX_TYPE)
+    index.add(vectors)
+
+    docstore = InMemoryDocstore({
+        doc_id: Document(page_content=text, metadata=metadata or {})
+        for doc_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"])
+    })
+    faiss_store = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=dict(enumerate(data["ids"])),
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+    )
+    faiss_store.save_local(FAISS_DIRECTORY)
+    print(f"  FAISS index built with {index.ntotal} vectors.")
+    logger.info(f"Built {type(index).__name__} with {index.ntotal} vectors at {FAISS_DIRECTORY}")
+
+@retry(
+    stop=stop_after_attempt(EMBEDDING_ATTEMPTS),
+    wait=wait_random_exponential(multiplier=1, max=EMBEDDING_RETRY_MAX_WAIT),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True,
+)
+async def _add_batch(collection, embeddings, batch: List[Document], write_lock: asyncio.Lock):
+    """
+    Embeds a batch of documents in a single request and writes the vectors to the collection.
+    Failed attempts are retried with jittered exponential backoff so that concurrent
+    batches don't all hit the endpoint again at the same moment.
+    """
+    texts = [doc.page_content for doc in batch]
+    vectors = await embeddings.aembed_documents([text[:EMBEDDING_MAX_CHARS] for text in texts])
+    # Chroma writes go through SQLite, so only one batch is written at a time
+    async with write_lock:
+        await asyncio.to_thread(
+            collection.add,
+            ids=[uuid4().hex for _ in batch],
+            embeddings=vectors,
+            documents=texts,
+            metadatas=[doc.metadata for doc in batch],
+        )
 
-def index_documents(documents: List[Document]):
+async def index_documents(documents: List[Document], embeddings: Optional[Embeddings] = None):
     """
-    Adds documents to the Chroma vector store.
+    Adds documents to the Chroma vector store, embedding several batches concurrently.
+    Pass embeddings to reuse an existing client instead of creating a new one.
     """
     if not documents:
         logger.warning("No documents to index.")
@@ -54,56 +242,37 @@ def index_documents(documents: List[Document]):
 
     print(f"  Indexing {len(documents)} chunks into vector database...")
     logger.info(f"Indexing {len(documents)} documents...")
-    embeddings = get_embeddings()
-    
-    # Batch size for embedding to avoid API timeouts
-    BATCH_SIZE = 32
-    
+    if embeddings is None:
+        embeddings = get_embeddings()
+
+    # Open the store once, sharing the embeddings client; batches are written
+    # straight to the underlying collection
+    collection = get_chroma_store(embeddings)._collection
+
+    semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+    write_lock = asyncio.Lock()
+
     total_docs = len(documents)
     total_batches = (total_docs + BATCH_SIZE - 1) // BATCH_SIZE
-    for i in range(0, total_docs, BATCH_SIZE):
+
+    async def _embed_and_add(i: int):
         batch = documents[i : i + BATCH_SIZE]
         batch_num = i // BATCH_SIZE + 1
-        print(f"  Batch {batch_num}/{total_batches} ({len(batch)} docs)...", end=" ", flush=True)
-        logger.info(f"Indexing batch {batch_num}/{total_batches} ({len(batch)} docs)")
-        
-        try:
-            # Create or update the vector store with the batch
-            if i == 0 and not os.path.exists(PERSIST_DIRECTORY):
-                 vector_store = Chroma.from_documents(
-                    documents=batch,
-                    embedding=embeddings,
-                    persist_directory=PERSIST_DIRECTORY
-                )
-            else:
-                vector_store = Chroma(persist_directory=PERSIST_DIRECTORY, embedding_function=embeddings)
-                vector_store.add_documents(batch)
-            print("done.")
-                
-        except Exception as e:
-            logger.error(f"Error indexing batch {i}: {e}")
-            # Simple retry logic could be added here
-            import time
-            time.sleep(5)
+        async with semaphore:
+            logger.info(f"Indexing batch {batch_num}/{total_batches} ({len(batch)} docs)")
             try:
-                logger.info("Retrying batch...")
-                vector_store = Chroma(persist_directory=PERSIST_DIRECTORY, embedding_function=embeddings)
-                vector_store.add_documents(batch)
-            except Exception as e2:
-                logger.error(f"Failed retry for batch {i}: {e2}")
+                await _add_batch(collection, embeddings, batch, write_lock)
+                print(f"  Batch {batch_num}/{total_batches} ({len(batch)} docs) done.")
+            except Exception as e:
+                logger.error(f"Failed to index batch {i} after {EMBEDDING_ATTEMPTS} attempts: {e}")
+
+    await asyncio.gather(*[_embed_and_add(i) for i in range(0, total_docs, BATCH_SIZE)])
 
     print("  Indexing complete!")
     logger.info("Indexing complete.")
 
-def clear_vector_store():
-    """
-    Clears the existing vector store by removing the persistence directory.
-    """
-    if os.path.exists(PERSIST_DIRECTORY):
-        shutil.rmtree(PERSIST_DIRECTORY)
-        logger.info("Vector store cleared.")
-
 if __name__ == "__main__":
     # Test
     # This assumes some documents are passed, or just testing init
+    setup_logging()
     get_vector_store()
@@ -1,11 +1,14 @@
+import asyncio
 import os
 import sys
-from src.chatbot import MedicalChatbot
 from src.utils import setup_logging, load_env_vars
 
+# Configure logging before importing modules that log at import time
 logger = setup_logging()
 
-def run_tests():
+from src.chatbot import MedicalChatbot
+
+async def run_tests():
     print("=== Running Verification Tests ===")
     load_env_vars()
     
@@ -31,11 +34,11 @@ def run_tests():
     for i, q in enumerate(test_questions, 1):
         print(f"\nTest Question {i}: {q}")
         try:
-            answer = bot.get_answer(q)
+            answer = await bot.get_answer(q)
             print(f"Answer:\n{answer}")
             print("-" * 50)
         except Exception as e:
             print(f"ERROR answering question {i}: {e}")
 
 if __name__ == "__main__":
-    run_tests()
+    asyncio.run(run_tests())
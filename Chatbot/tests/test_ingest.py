@@ -0,0 +1,49 @@
+import pytest
+from src.ingest import StructuralTextSplitter, clean_text_content, split_into_blocks
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("Take ½ tablet", "Take 1/2 tablet"),
+    ("dose ¼ mg", "dose 1/4 mg"),
+    ("5‐10 mg daily", "5-10 mg daily"),
+    ("5‑10 mg daily", "5-10 mg daily"),
+    ("5‒10 mg daily", "5-10 mg daily"),
+    ("5–10 mg daily", "5-10 mg daily"),
+    ("10⁻³ M", "10^-3 M"),
+    ("area 2 m²", "area 2 m^2"),
+    ("5 µg ≥ 10 °C", "5 ug >= 10 degC"),
+    ("5 μg daily", "5 ug daily"),
+    ("range −2 ± 1", "range -2 +/- 1"),
+    ("dose ≤ 3×4 mg", "dose <= 3x4 mg"),
+])
+def test_clean_text_content_keeps_dose_symbols(raw, expected):
+    assert clean_text_content(raw) == expected
+
+
+PAGE = (
+    "```python\nx = 1\n```\n\n"
+    "DOSAGE TABLE\n"
+    "| Drug | Dose |\n|---|---|\n| Aspirin | 81 mg |\n| Metformin | 500 mg |\n\n"
+    "\u2022 Take with food\n\u2022 Avoid alcohol"
+)
+
+
+def test_cleaned_text_keeps_structure():
+    blocks = split_into_blocks(clean_text_content(PAGE))
+
+    assert [kind for kind, _ in blocks] == ["code", "heading", "table", "list"]
+    assert blocks[0][1] == "```python\nx = 1\n```"
+    assert blocks[3][1] == "- Take with food\n- Avoid alcohol"
+
+
+def test_table_chunks_split_between_rows_with_header():
+    rows = "\n".join(f"| Drug {i} | {i * 10} mg once daily with water |" for i in range(40))
+    text = clean_text_content(f"| Drug | Dose |\n|---|---|\n{rows}")
+
+    chunks = StructuralTextSplitter(chunk_tokens=100).split_text(text)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        lines = chunk.split("\n")
+        assert lines[:2] == ["| Drug | Dose |", "|---|---|"]
+        assert all(line.startswith("| Drug ") and line.endswith("|") for line in lines[2:])